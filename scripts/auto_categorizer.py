@@ -10,9 +10,15 @@ src/data/category_map.json に定義されたキーワードマップを用い
 外部APIやLLMには依存せず、既存のデータのみを用いてスコアリング分類を行います。
 """
 
+import argparse
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Mapping
+from typing import Any, Dict, List, Mapping, Tuple
+
+import ahocorasick
+import orjson
+
+from io_utils import write_bytes_atomic
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 PRODUCTS_PATH = BASE_DIR / "data" / "products.json"
@@ -24,26 +30,23 @@ def load_products() -> List[Dict[str, Any]]:
   if not PRODUCTS_PATH.exists():
     raise FileNotFoundError(f"products.json が見つかりません: {PRODUCTS_PATH}")
 
-  with PRODUCTS_PATH.open("r", encoding="utf-8") as f:
-    return json.load(f)
+  return orjson.loads(PRODUCTS_PATH.read_bytes())
 
 
-def save_products(products: List[Dict[str, Any]]) -> None:
-  """products.json を上書き保存する（UTF-8 / インデント付き）"""
-  with PRODUCTS_PATH.open("w", encoding="utf-8") as f:
-    json.dump(products, f, ensure_ascii=False, indent=2)
+def save_products(products: List[Dict[str, Any]], compact: bool = False) -> None:
+  """products.json を上書き保存する（UTF-8 / 既定はインデント付き、compact=True のときのみコンパクト形式）"""
+  option = None if compact else orjson.OPT_INDENT_2
+  write_bytes_atomic(PRODUCTS_PATH, orjson.dumps(products, option=option))
 
 
 def is_unclassified(product: Dict[str, Any]) -> bool:
   """カテゴリが未分類（空 or 'その他'）かどうかを判定"""
   category = product.get("category")
-  if category is None:
-    return True
-  if isinstance(category, str) and category.strip() == "":
-    return True
-  if category == "その他":
-    return True
-  return False
+  return (
+    category is None
+    or category == "その他"
+    or (isinstance(category, str) and not category.strip())
+  )
 
 
 def load_category_map() -> Mapping[str, List[str]]:
@@ -60,23 +63,14 @@ def load_category_map() -> Mapping[str, List[str]]:
   return data
 
 
-def classify_by_scoring(product_name: str, category_map: Mapping[str, List[str]]) -> str:
+def preprocess_map(category_map: Mapping[str, List[str]]) -> List[Tuple[str, str, float]]:
   """
-  既存の category_map.json を用いてスコアリング分類を行う。
+  category_map を (小文字化したキーワード, カテゴリ名, キーワード長の重み) のリストに正規化する。
 
-  スコア = Σ (キーワードの出現回数 × キーワード長の重み)
-  - 商品名内に長いキーワードが複数回出現するカテゴリほどスコアが高くなる（長いフレーズを優遇）。
-  - 1カテゴリ内の全キーワードについてスコアを合算し、最大スコアのカテゴリを採用。
-  - 「その他」はスコアリング対象から一旦外し、他カテゴリがマッチしない場合のみフォールバックとして使用する。
+  キーワードの小文字化や重みの計算はカテゴリマップだけで決まるため、
+  load_category_map() の直後に1回だけ行う。並び順は category_map の定義順を保つ。
   """
-  name = product_name or ""
-  if not name:
-    return "その他"
-
-  name_norm = name.lower()
-
-  best_category = "その他"
-  best_score = 0.0
+  table: List[Tuple[str, str, float]] = []
 
   for category, keywords in category_map.items():
     # 「その他」はフォールバック用にのみ使用し、ここではスコアリング対象から除外
@@ -86,67 +80,129 @@ def classify_by_scoring(product_name: str, category_map: Mapping[str, List[str]]
     if not isinstance(keywords, list):
       continue
 
-    score = 0.0
     for kw in keywords:
       if not kw:
         continue
-      kw_str = str(kw)
       # キーワードも小文字化して部分一致を取る（日本語も一応lower()で揃える）
-      kw_norm = kw_str.lower()
+      kw_norm = str(kw).lower()
       # あまりに短いキーワード（1〜2文字）はノイズになりやすいので無視
       if len(kw_norm) <= 2:
         continue
-      if kw_norm in name_norm:
-        # 出現回数を数える（オーバーラップは無視）
-        occurrences = name_norm.count(kw_norm)
-        # キーワード長に基づく重み（長いフレーズを少し強めに評価）
-        base_len = len(kw_norm)
-        length_weight = base_len ** 1.2
-        score += occurrences * length_weight
-
-    if score > best_score:
-      best_score = score
-      best_category = category
+      # キーワード長に基づく重み（長いフレーズを少し強めに評価）
+      table.append((kw_norm, category, len(kw_norm) ** 1.2))
+
+  return table
+
+
+def build_automaton(table: List[Tuple[str, str, float]]) -> ahocorasick.Automaton:
+  """
+  preprocess_map で正規化したキーワード表から Aho–Corasick オートマトンを構築する。
+
+  商品ごとではなく実行ごとに1回だけ構築し、classify_by_scoring に渡して使い回す。
+  同じキーワードが複数カテゴリに登録されている場合もあるため、ペイロードは
+  (キーワード, キーワード長の重み, [(カテゴリ順, カテゴリ名), ...]) とする。
+  """
+  automaton = ahocorasick.Automaton()
+  ranks: Dict[str, int] = {}
+
+  for kw_norm, category, length_weight in table:
+    rank = ranks.setdefault(category, len(ranks))
+    if kw_norm in automaton:
+      automaton.get(kw_norm)[2].append((rank, category))
+    else:
+      automaton.add_word(kw_norm, (kw_norm, length_weight, [(rank, category)]))
+
+  automaton.make_automaton()
+  return automaton
+
+
+def classify_by_scoring(product_name: str, automaton: ahocorasick.Automaton) -> str:
+  """
+  build_automaton で構築したオートマトンを用いてスコアリング分類を行う。
+
+  スコア = Σ (キーワードの出現回数 × キーワード長の重み)
+  - 商品名内に長いキーワードが複数回出現するカテゴリほどスコアが高くなる（長いフレーズを優遇）。
+  - 1カテゴリ内の全キーワードについてスコアを合算し、最大スコアのカテゴリを採用。
+  - 「その他」はスコアリング対象から一旦外し、他カテゴリがマッチしない場合のみフォールバックとして使用する。
+  """
+  name = product_name or ""
+  # キーワードが1つも登録されていない場合、オートマトンは構築されず iter() を呼べないので「その他」
+  if not name or len(automaton) == 0:
+    return "その他"
+
+  name_norm = name.lower()
+
+  # 商品名を1回走査するだけで、全キーワードの出現をスコアに加算する
+  scores: Dict[Tuple[int, str], float] = {}
+  last_end: Dict[str, int] = {}
+  for end_index, (kw_norm, length_weight, targets) in automaton.iter(name_norm):
+    # 同じキーワード同士のオーバーラップは数えない（str.count と同じ数え方）
+    if end_index - len(kw_norm) < last_end.get(kw_norm, -1):
+      continue
+    last_end[kw_norm] = end_index
+    for target in targets:
+      scores[target] = scores.get(target, 0.0) + length_weight
 
   # 1つもマッチしなければ「その他」
+  if not scores:
+    return "その他"
+
+  # 最大スコアのカテゴリを採用し、同点の場合は category_map で先に定義されたカテゴリを優先する
+  (_, best_category), best_score = max(scores.items(), key=lambda item: (item[1], -item[0][0]))
   if best_score <= 0:
     return "その他"
 
   return best_category
 
 
+def classify_batch(product_names: List[str], automaton: ahocorasick.Automaton) -> List[str]:
+  """
+  複数の商品名をまとめて分類し、入力と同じ順序でカテゴリのリストを返す。
+
+  同じ商品名（重複登録・シリーズ物など）は同じ分類結果になるため、1回だけ分類して使い回す。
+  将来 LLM などの外部分類器に置き換える場合も、この関数単位で1回のリクエストにまとめられる。
+  """
+  results: Dict[str, str] = {}
+  for name in product_names:
+    if name not in results:
+      results[name] = classify_by_scoring(name, automaton)
+  return [results[name] for name in product_names]
+
+
 def main() -> None:
+  parser = argparse.ArgumentParser(description="未分類の商品にカテゴリを自動付与する")
+  parser.add_argument("--compact", action="store_true", help="products.json をインデントなしのコンパクト形式で保存する（既定はインデント付き）")
+  args = parser.parse_args()
+
   products = load_products()
   category_map = load_category_map()
+  automaton = build_automaton(preprocess_map(category_map))
   print(f"[INFO] 全商品数: {len(products)}")
 
-  # 未分類の商品を抽出
-  unclassified_indices: List[int] = []
-  for idx, p in enumerate(products):
-    if is_unclassified(p):
-      unclassified_indices.append(idx)
+  # 未分類の商品を抽出（dict は products と共有しているので、そのまま書き換えればよい）
+  to_update = [p for p in products if is_unclassified(p)]
 
-  if not unclassified_indices:
+  if not to_update:
     print("[INFO] 未分類（その他/空）の商品はありません。処理を終了します。")
     return
 
-  print(f"[INFO] 未分類の商品数: {len(unclassified_indices)}")
+  print(f"[INFO] 未分類の商品数: {len(to_update)}")
+
+  # 分類（全件まとめて）と上書き
+  names = [p.get("name", "") for p in to_update]
+  new_categories = classify_batch(names, automaton)
 
-  # 分類と上書き
   updated_count = 0
-  for idx in unclassified_indices:
-    product = products[idx]
-    name = product.get("name", "")
+  for product, name, new_category in zip(to_update, names, new_categories):
     before = product.get("category")
-    new_category = classify_by_scoring(name, category_map)
-    products[idx]["category"] = new_category
+    product["category"] = new_category
     updated_count += 1
     print(
       f"[UPDATE] id={product.get('id')} "
       f"'{name[:40]}...' category: {before} -> {new_category}"
     )
 
-  save_products(products)
+  save_products(products, compact=args.compact)
   print(f"[DONE] {updated_count} 件の商品カテゴリを更新しました。")
 
 
@@ -4,10 +4,15 @@
 「その他」カテゴリまたはカテゴリが空欄の商品に対して、正しいカテゴリを割り当てるインタラクティブツール
 """
 
+import argparse
 import json
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+import orjson
+
+from io_utils import write_bytes_atomic
 
 # プロジェクトルートのパスを取得
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -35,63 +40,66 @@ def load_products() -> List[Dict]:
         sys.exit(1)
     
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return orjson.loads(DATA_FILE.read_bytes())
     except Exception as e:
         print(f"エラー: 商品データの読み込みに失敗しました: {e}")
         sys.exit(1)
 
 
-def load_category_map() -> Dict[str, List[str]]:
-    """カテゴリマッピングを読み込む"""
+def load_category_map() -> Dict[str, Dict[str, None]]:
+    """
+    カテゴリマッピングを読み込む
+    キーワードの重複チェックをO(1)で行えるよう、各カテゴリのキーワードは
+    登録順を保った dict（dict.fromkeys）として保持する
+    """
     if not CATEGORY_MAP_FILE.exists():
         print(f"警告: {CATEGORY_MAP_FILE} が見つかりません。新規作成します。")
         return {}
     
     try:
         with open(CATEGORY_MAP_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+            data = json.load(f)
+        return {category: dict.fromkeys(keywords) for category, keywords in data.items()}
     except Exception as e:
         print(f"警告: カテゴリマッピングの読み込みに失敗しました: {e}")
         return {}
 
 
-def save_products(products: List[Dict]) -> None:
-    """商品データを保存する"""
+def save_products(products: List[Dict], compact: bool = False) -> None:
+    """商品データを保存する（既定はインデント付き、compact=True のときのみコンパクト形式）"""
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(products, f, ensure_ascii=False, indent=2)
+        option = None if compact else orjson.OPT_INDENT_2
+        write_bytes_atomic(DATA_FILE, orjson.dumps(products, option=option))
         print(f"✓ 商品データを保存しました: {DATA_FILE}")
     except Exception as e:
         print(f"エラー: 商品データの保存に失敗しました: {e}")
         sys.exit(1)
 
 
-def save_category_map(category_map: Dict[str, List[str]]) -> None:
-    """カテゴリマッピングを保存する"""
+def save_category_map(category_map: Dict[str, Dict[str, None]]) -> None:
+    """カテゴリマッピングを保存する（キーワードは登録順のリストとして書き出す）"""
     try:
         # ディレクトリが存在しない場合は作成
         CATEGORY_MAP_FILE.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(CATEGORY_MAP_FILE, "w", encoding="utf-8") as f:
-            json.dump(category_map, f, ensure_ascii=False, indent=2)
+        data = {category: list(keywords) for category, keywords in category_map.items()}
+        write_bytes_atomic(CATEGORY_MAP_FILE, orjson.dumps(data, option=orjson.OPT_INDENT_2))
         print(f"✓ カテゴリマッピングを保存しました: {CATEGORY_MAP_FILE}")
     except Exception as e:
         print(f"エラー: カテゴリマッピングの保存に失敗しました: {e}")
         sys.exit(1)
 
 
-def filter_uncategorized_products(products: List[Dict]) -> List[tuple[int, Dict]]:
+def iter_uncategorized(products: List[Dict]) -> Iterator[tuple[int, Dict]]:
     """
-    カテゴリが「その他」または空欄の商品を抽出
-    戻り値: (インデックス, 商品データ) のタプルのリスト
+    カテゴリが「その他」または空欄の商品を順に返すジェネレータ
+    戻り値: (インデックス, 商品データ) のタプル
     """
-    uncategorized = []
-    for idx, product in enumerate(products):
-        category = product.get("category", "").strip()
-        if not category or category == "その他":
-            uncategorized.append((idx, product))
-    return uncategorized
+    return (
+        (idx, product)
+        for idx, product in enumerate(products)
+        if not (category := product.get("category", "").strip()) or category == "その他"
+    )
 
 
 def display_product_info(product: Dict, index: int, total: int) -> None:
@@ -156,13 +164,13 @@ def get_user_input() -> Optional[str]:
         print("エラー: 無効な入力です。もう一度入力してください。")
 
 
-def add_keyword_to_category_map(category_map: Dict[str, List[str]], category: str, product_name: str) -> None:
+def add_keyword_to_category_map(category_map: Dict[str, Dict[str, None]], category: str, product_name: str) -> None:
     """
     商品名からキーワードを抽出し、カテゴリマッピングに追加
     簡易的な実装: 商品名の最初の数語をキーワードとして追加
     """
     if category not in category_map:
-        category_map[category] = []
+        category_map[category] = {}
     
     # 商品名から主要なキーワードを抽出（簡易版）
     # 実際の実装では、より高度なキーワード抽出が必要かもしれません
@@ -171,12 +179,16 @@ def add_keyword_to_category_map(category_map: Dict[str, List[str]], category: st
         # 最初の単語をキーワード候補として追加（重複チェック）
         keyword = words[0]
         if keyword not in category_map[category]:
-            category_map[category].append(keyword)
+            category_map[category][keyword] = None
             print(f"  → キーワード「{keyword}」をカテゴリ「{category}」に追加しました")
 
 
 def main():
     """メイン処理"""
+    parser = argparse.ArgumentParser(description="未分類の商品にカテゴリを対話的に割り当てる")
+    parser.add_argument("--compact", action="store_true", help="products.json をインデントなしのコンパクト形式で保存する（既定はインデント付き）")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("  TRENDIX - カテゴリ管理ツール")
     print("=" * 60)
@@ -191,8 +203,8 @@ def main():
     print(f"✓ カテゴリマッピング: {len(category_map)}カテゴリ")
     print()
     
-    # 未分類商品を抽出
-    uncategorized = filter_uncategorized_products(products)
+    # 未分類商品を抽出（件数表示のため1回だけリスト化する）
+    uncategorized = list(iter_uncategorized(products))
     
     if not uncategorized:
         print("✓ すべての商品にカテゴリが設定されています！")
@@ -217,7 +229,7 @@ def main():
             print("\n処理を中断します。変更を保存しますか？")
             save_choice = input("(y/N): ").strip().lower()
             if save_choice == "y":
-                save_products(products)
+                save_products(products, compact=args.compact)
                 save_category_map(category_map)
             print("処理を終了しました。")
             return
@@ -240,7 +252,7 @@ def main():
         if category not in AVAILABLE_CATEGORIES:
             new_categories.append(category)
             if category not in category_map:
-                category_map[category] = []
+                category_map[category] = {}
         
         # カテゴリマッピングにキーワードを追加（学習機能）
         add_keyword_to_category_map(category_map, category, product.get("name", ""))
@@ -262,7 +274,7 @@ def main():
         print("変更を保存しますか？")
         save_choice = input("(Y/n): ").strip().lower()
         if save_choice != "n":
-            save_products(products)
+            save_products(products, compact=args.compact)
             save_category_map(category_map)
             print("\n✓ すべての変更を保存しました！")
         else:
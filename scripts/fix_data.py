@@ -4,10 +4,14 @@
 products.jsonのデータをクリーンアップし、ダミー商品を削除する
 """
 
-import json
+import argparse
 import re
 from pathlib import Path
 
+import orjson
+
+from io_utils import write_bytes_atomic
+
 # プロジェクトルートのパスを取得
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_FILE = PROJECT_ROOT / "data" / "products.json"
@@ -15,25 +19,19 @@ DATA_FILE = PROJECT_ROOT / "data" / "products.json"
 # アフィリエイトID
 ASSOCIATE_TAG = "xiora-22"
 
+# URLからASINを抽出する正規表現（/dp/ASIN または /gp/product/ASIN）
+_ASIN_RE = re.compile(r"/(?:dp|gp/product)/([A-Z0-9]{10})")
+
 
-def extract_asin_from_url(url: str) -> str | None:
+def extract_asin_from_url(url: str | None) -> str | None:
     """
     URLからASINを抽出する
     """
     if not url:
         return None
     
-    # /dp/ASIN パターン
-    match = re.search(r"/dp/([A-Z0-9]{10})", url)
-    if match:
-        return match.group(1)
-    
-    # /gp/product/ASIN パターン
-    match = re.search(r"/gp/product/([A-Z0-9]{10})", url)
-    if match:
-        return match.group(1)
-    
-    return None
+    match = _ASIN_RE.search(url)
+    return match.group(1) if match else None
 
 
 def build_affiliate_url(asin: str) -> str:
@@ -43,7 +41,20 @@ def build_affiliate_url(asin: str) -> str:
     return f"https://www.amazon.co.jp/dp/{asin}?tag={ASSOCIATE_TAG}"
 
 
-def fix_data():
+def _strip_if_dirty(product: dict, key: str) -> bool:
+    """
+    フィールドの前後に空白・改行がある場合のみ strip して書き戻す
+    大半のURLはすでにクリーンなため、先頭と末尾の1文字だけを見て不要な文字列の生成を避ける
+    書き換えた場合は True を返す
+    """
+    value = product.get(key)
+    if value and (value[0].isspace() or value[-1].isspace()):
+        product[key] = value.strip()
+        return True
+    return False
+
+
+def fix_data(compact: bool = False):
     """データを洗浄する"""
     
     # products.jsonを読み込む
@@ -51,8 +62,7 @@ def fix_data():
         print(f"エラー: {DATA_FILE} が見つかりません")
         return
     
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        products = json.load(f)
+    products = orjson.loads(DATA_FILE.read_bytes())
     
     print(f"読み込み完了: {len(products)}件の商品")
     
@@ -75,40 +85,25 @@ def fix_data():
             continue
         
         # affiliateUrlの空白・改行を削除
+        if _strip_if_dirty(product, "affiliateUrl"):
+            fixed_count += 1
         affiliate_url = product.get("affiliateUrl", "")
-        if affiliate_url:
-            original_url = affiliate_url
-            affiliate_url = affiliate_url.strip()
-            if original_url != affiliate_url:
-                product["affiliateUrl"] = affiliate_url
-                fixed_count += 1
         
         # urlフィールドがあれば処理（念のため）
-        if "url" in product:
-            original_url = product["url"]
-            product["url"] = product["url"].strip()
-            if original_url != product["url"]:
-                fixed_count += 1
+        if _strip_if_dirty(product, "url"):
+            fixed_count += 1
         
         # affiliateLinkフィールドがあれば処理（念のため）
-        if "affiliateLink" in product:
-            original_link = product["affiliateLink"]
-            product["affiliateLink"] = product["affiliateLink"].strip()
-            if original_link != product["affiliateLink"]:
-                fixed_count += 1
+        if _strip_if_dirty(product, "affiliateLink"):
+            fixed_count += 1
         
         # アフィリエイトリンクが空の場合は再生成
-        if not affiliate_url or affiliate_url == "":
-            # 既存のURLからASINを抽出
-            asin = extract_asin_from_url(affiliate_url)
-            
-            # 他のフィールドからASINを探す
-            if not asin and "url" in product:
-                asin = extract_asin_from_url(product.get("url", ""))
+        if not affiliate_url:
+            # affiliateUrl は空なので、他のフィールド（url）からASINを探す
+            asin = extract_asin_from_url(product.get("url"))
             
             if asin:
-                new_url = build_affiliate_url(asin)
-                product["affiliateUrl"] = new_url
+                product["affiliateUrl"] = build_affiliate_url(asin)
                 regenerated_count += 1
                 print(f"  再生成: ID={product_id} ({product.get('name', 'Unknown')[:50]}...)")
             else:
@@ -117,8 +112,8 @@ def fix_data():
         fixed_products.append(product)
     
     # 修正したデータを保存
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(fixed_products, f, ensure_ascii=False, indent=2)
+    option = None if compact else orjson.OPT_INDENT_2
+    write_bytes_atomic(DATA_FILE, orjson.dumps(fixed_products, option=option))
     
     # ログ出力
     print(f"\n{'='*60}")
@@ -133,5 +128,8 @@ def fix_data():
 
 
 if __name__ == "__main__":
-    fix_data()
+    parser = argparse.ArgumentParser(description="products.json のデータを洗浄する")
+    parser.add_argument("--compact", action="store_true", help="products.json をインデントなしのコンパクト形式で保存する（既定はインデント付き）")
+    args = parser.parse_args()
+    fix_data(compact=args.compact)
 
@@ -4,16 +4,20 @@ Amazonキーワード検索から商品を自動収集し、アフィリエイ
 keywords.txtのキーワードを読み込み、各キーワードでAmazon検索を行い、商品情報を抽出してproducts.jsonに追記する
 """
 
+import argparse
 import json
-import random
 import re
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import urljoin, quote_plus
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+from io_utils import DomainRateLimiter, create_session, write_bytes_atomic
 
 # ============================================================================
 # 設定値
@@ -31,6 +35,38 @@ CATEGORY_MAP_FILE = PROJECT_ROOT / "src" / "data" / "category_map.json"
 # 各キーワードあたりの検索ページ数
 PAGES_PER_KEYWORD = 3
 
+# 検索ページを並列に取得するスレッド数
+MAX_WORKERS = 8
+
+# 同じドメインへのリクエスト間隔（秒）。この範囲でランダムに間隔を空ける
+REQUEST_INTERVAL_RANGE = (2.0, 5.0)
+
+# URLからASINを抽出する正規表現（/dp/ASIN または /gp/product/ASIN）
+_ASIN_RE = re.compile(r"/(?:dp|gp/product)/([A-Z0-9]{10})")
+
+# 商品ページへのリンクを探すCSSセレクタ
+PRODUCT_LINK_SELECTOR = 'a[href*="/dp/"], a[href*="/gp/product/"]'
+
+# 価格テキストから数字を抽出する正規表現
+_PRICE_DIGITS_RE = re.compile(r"[\d,]+")
+
+# 商品コンテナのテキストから価格らしい表記を探す正規表現（優先順）
+_PRICE_TEXT_RES = (
+    re.compile(r"¥\s*([\d,]+)"),
+    re.compile(r"([\d,]+)\s*円"),
+    re.compile(r"([\d,]+)\s*JPY"),
+)
+
+# 検索結果ページの商品コンテナを探すCSSセレクタ
+# - div[data-asin][data-index]: 検索結果ページの標準パターン
+# - div[data-component-type="s-search-result"]: 検索結果ページ用
+# - div.s-result-item: 検索結果ページ用（クラス名の部分一致）
+PRODUCT_CONTAINER_SELECTOR = ", ".join([
+    "div[data-asin][data-index]",
+    'div[data-component-type="s-search-result"]',
+    'div[class*="s-result-item"]',
+])
+
 # User-Agentヘッダー（ブラウザからのアクセスに見せかける）
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -42,47 +78,41 @@ HEADERS = {
 }
 
 
+# 全リクエストで共有するHTTPセッション
+SESSION = create_session(HEADERS, MAX_WORKERS)
+
+
 # ============================================================================
 # ユーティリティ関数
 # ============================================================================
 
-def random_sleep(min_seconds: float = 2.0, max_seconds: float = 5.0):
-    """
-    ランダムな時間待機する（サーバー負荷対策）
-    """
-    sleep_time = random.uniform(min_seconds, max_seconds)
-    time.sleep(sleep_time)
+# 全スレッドで共有するレートリミッター
+RATE_LIMITER = DomainRateLimiter(*REQUEST_INTERVAL_RANGE)
 
 
 def extract_asin_from_url(url: str) -> str | None:
     """
     URLからASINを抽出する
     """
-    # /dp/ASIN パターン
-    match = re.search(r"/dp/([A-Z0-9]{10})", url)
-    if match:
-        return match.group(1)
-    
-    # /gp/product/ASIN パターン
-    match = re.search(r"/gp/product/([A-Z0-9]{10})", url)
-    if match:
-        return match.group(1)
-    
-    return None
+    match = _ASIN_RE.search(url)
+    return match.group(1) if match else None
 
 
 def get_existing_asins(products: list) -> set[str]:
     """
     既存の商品データからASINのセットを取得する
+    asin フィールドを持たない商品は affiliateUrl からASINを抽出し、次回以降は正規表現が不要になるよう asin フィールドに保存する
     """
     asins = set()
     
     for product in products:
-        affiliate_url = product.get("affiliateUrl", "")
-        if affiliate_url:
-            asin = extract_asin_from_url(affiliate_url)
-            if asin:
-                asins.add(asin)
+        asin = product.get("asin")
+        if not asin:
+            asin = extract_asin_from_url(product.get("affiliateUrl") or "")
+            if not asin:
+                continue
+            product["asin"] = asin
+        asins.add(asin)
     
     return asins
 
@@ -135,27 +165,46 @@ def load_category_map() -> dict[str, list[str]]:
         return {}
 
 
-def assign_category(product_name: str, category_map: dict[str, list[str]]) -> str:
+def build_keyword_index(category_map: dict[str, list[str]]) -> tuple[re.Pattern | None, dict[str, tuple[int, int, str]]]:
+    """
+    カテゴリマッピングの全キーワードを1つの正規表現（選択）にまとめる
+    戻り値: (正規表現, {小文字化したキーワード: (キーワード長, 登録順, カテゴリ)})
+    同じキーワードが複数カテゴリにある場合は、先に登録されたカテゴリを採用する
+    """
+    keyword_info: dict[str, tuple[int, int, str]] = {}
+    rank = 0
+    for category, keywords in category_map.items():
+        for keyword in keywords:
+            keyword_lower = keyword.lower()
+            if keyword_lower and keyword_lower not in keyword_info:
+                keyword_info[keyword_lower] = (len(keyword), rank, category)
+            rank += 1
+    
+    if not keyword_info:
+        return None, keyword_info
+    
+    # 各位置で最も長いキーワードが選ばれるよう、長い順に並べる
+    # 先読み (?=...) にすることで、重なり合うキーワードもすべて列挙できる
+    alternation = "|".join(re.escape(k) for k in sorted(keyword_info, key=len, reverse=True))
+    return re.compile(f"(?=({alternation}))"), keyword_info
+
+
+def assign_category(product_name: str, keyword_index: tuple[re.Pattern | None, dict[str, tuple[int, int, str]]]) -> str:
     """
     商品名に対してカテゴリマッピングを適用し、最も適切なカテゴリを返す
     複数のカテゴリに一致した場合は、最も長く一致したキーワードを持つカテゴリを優先
+    （同じ長さの場合は先に登録されたキーワードを優先）
     """
-    if not category_map:
+    pattern, keyword_info = keyword_index
+    if pattern is None:
         return "その他"
     
-    product_name_lower = product_name.lower()
-    best_category = "その他"
-    best_match_length = 0
-    
-    for category, keywords in category_map.items():
-        for keyword in keywords:
-            keyword_lower = keyword.lower()
-            if keyword_lower in product_name_lower:
-                # より長いキーワードに一致した場合は優先
-                if len(keyword) > best_match_length:
-                    best_match_length = len(keyword)
-                    best_category = category
+    # 商品名を1回走査して、含まれるキーワードをすべて取得する
+    matched = {match.group(1) for match in pattern.finditer(product_name.lower())}
+    if not matched:
+        return "その他"
     
+    _, _, best_category = max((keyword_info[k] for k in matched), key=lambda info: (info[0], -info[1]))
     return best_category
 
 
@@ -181,39 +230,35 @@ def extract_product_name(element) -> str | None:
     商品コンテナ要素から商品名を抽出する
     """
     # パターン1: h2タグ内のaタグ（検索結果ページの標準パターン）
-    h2_tag = element.find("h2")
-    if h2_tag:
-        a_tag = h2_tag.find("a")
-        if a_tag:
-            # spanタグ内のテキストを優先
-            span_tag = a_tag.find("span")
-            if span_tag:
-                name = span_tag.get_text(strip=True)
-                if name and len(name) > 3:
-                    return name
-            else:
-                name = a_tag.get_text(strip=True)
-                if name and len(name) > 3:
-                    return name
+    a_tag = element.css_first("h2 a")
+    if a_tag:
+        # spanタグ内のテキストを優先
+        span_tag = a_tag.css_first("span")
+        if span_tag:
+            name = span_tag.text(strip=True)
+            if name and len(name) > 3:
+                return name
+        else:
+            name = a_tag.text(strip=True)
+            if name and len(name) > 3:
+                return name
     
     # パターン2: imgタグのalt属性
-    img_tag = element.find("img")
-    if img_tag and img_tag.get("alt"):
-        name = img_tag.get("alt", "").strip()
+    img_tag = element.css_first("img[alt]")
+    if img_tag:
+        name = (img_tag.attributes.get("alt") or "").strip()
         if name and len(name) > 3 and name != "Sponsored":
             return name
     
     # パターン3: class="a-text-normal" を含む要素
-    text_elements = element.find_all(class_=re.compile(r"a-text-normal"))
-    for text_elem in text_elements:
-        text = text_elem.get_text(strip=True)
+    for text_elem in element.css('[class*="a-text-normal"]'):
+        text = text_elem.text(strip=True)
         if text and len(text) > 10:  # 商品名らしい長さのテキスト
             return text
     
     # パターン4: class="a-size-base-plus" を含む要素
-    size_elements = element.find_all(class_=re.compile(r"a-size-base-plus|a-size-medium"))
-    for size_elem in size_elements:
-        text = size_elem.get_text(strip=True)
+    for size_elem in element.css('[class*="a-size-base-plus"], [class*="a-size-medium"]'):
+        text = size_elem.text(strip=True)
         if text and len(text) > 3:
             return text
     
@@ -224,10 +269,10 @@ def extract_image_url(element, base_url: str) -> str:
     """
     商品コンテナ要素から画像URLを抽出する
     """
-    img_tag = element.find("img")
+    img_tag = element.css_first("img")
     if img_tag:
         # data-src属性を優先（遅延読み込み対応）
-        image_url = img_tag.get("data-src") or img_tag.get("src")
+        image_url = img_tag.attributes.get("data-src") or img_tag.attributes.get("src")
         if image_url:
             # 相対URLの場合は絶対URLに変換
             if image_url.startswith("//"):
@@ -247,20 +292,20 @@ def extract_price(element) -> int:
     商品コンテナ要素から価格を抽出する
     """
     # パターン1: class="a-price-whole" を含む要素（整数部分）
-    price_whole = element.find(class_=re.compile(r"a-price-whole"))
+    price_whole = element.css_first('[class*="a-price-whole"]')
     if price_whole:
-        price_text = price_whole.get_text(strip=True).replace(",", "").replace("¥", "")
+        price_text = price_whole.text(strip=True).replace(",", "").replace("¥", "")
         try:
             return int(price_text)
         except ValueError:
             pass
     
     # パターン2: class="a-price" を含む要素
-    price_elem = element.find(class_=re.compile(r"a-price"))
+    price_elem = element.css_first('[class*="a-price"]')
     if price_elem:
-        price_text = price_elem.get_text(strip=True)
+        price_text = price_elem.text(strip=True)
         # 数字のみを抽出
-        price_match = re.search(r"[\d,]+", price_text.replace(",", ""))
+        price_match = _PRICE_DIGITS_RE.search(price_text.replace(",", ""))
         if price_match:
             try:
                 return int(price_match.group(0))
@@ -268,16 +313,12 @@ def extract_price(element) -> int:
                 pass
     
     # パターン3: 価格らしいテキストを直接検索
-    price_patterns = [
-        r"¥\s*([\d,]+)",
-        r"([\d,]+)\s*円",
-        r"([\d,]+)\s*JPY",
-    ]
-    for pattern in price_patterns:
-        matches = re.findall(pattern, element.get_text())
-        if matches:
+    element_text = element.text()
+    for pattern in _PRICE_TEXT_RES:
+        match = pattern.search(element_text)
+        if match:
             try:
-                price_str = matches[0].replace(",", "")
+                price_str = match.group(1).replace(",", "")
                 return int(price_str)
             except ValueError:
                 continue
@@ -292,12 +333,12 @@ def extract_product_from_element(element, base_url: str) -> dict | None:
     """
     try:
         # ASINを取得
-        asin = element.get("data-asin")
+        asin = element.attributes.get("data-asin")
         if not asin or asin.strip() == "":
             # data-asin属性がない場合は、リンクからASINを抽出
-            link_tag = element.find("a", href=re.compile(r"/dp/|/gp/product/"))
+            link_tag = element.css_first(PRODUCT_LINK_SELECTOR)
             if link_tag:
-                href = link_tag.get("href", "")
+                href = link_tag.attributes.get("href") or ""
                 # 相対URLの場合は絶対URLに変換
                 if href.startswith("/"):
                     href = urljoin(base_url, href)
@@ -330,47 +371,40 @@ def extract_product_from_element(element, base_url: str) -> dict | None:
         return None
 
 
-def scrape_search_page(url: str) -> list[dict]:
+def scrape_search_page(url: str, stop_event: threading.Event | None = None) -> list[dict]:
     """
     検索結果ページから商品情報を抽出する
+    stop_event がセットされた場合は、リクエストを送らずに空のリストを返す
     """
     products = []
     
+    # サーバー負荷を考慮して、同じドメインへのリクエストは間隔を空ける（待機中に停止指示が出たら中止）
+    if not RATE_LIMITER.wait(url, stop_event):
+        return products
+    
     try:
         print(f"  アクセス中: {url}")
-        response = requests.get(url, headers=HEADERS, timeout=15)
+        response = SESSION.get(url, timeout=15)
         
         if response.status_code != 200:
             print(f"  エラー: ステータスコード {response.status_code}")
             return products
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # 検索結果ページの商品コンテナを探す
-        product_elements = []
-        
-        # パターン1: div[data-asin] 属性を持つ要素（検索結果ページの標準パターン）
-        elements_1 = soup.find_all("div", attrs={"data-asin": True, "data-index": True})
-        product_elements.extend(elements_1)
-        
-        # パターン2: div[data-component-type="s-search-result"]（検索結果ページ用）
-        elements_2 = soup.find_all("div", attrs={"data-component-type": "s-search-result"})
-        product_elements.extend(elements_2)
+        tree = LexborHTMLParser(response.text)
         
-        # パターン3: div.s-result-item（検索結果ページ用）
-        elements_3 = soup.find_all("div", class_=re.compile(r"s-result-item"))
-        product_elements.extend(elements_3)
+        # 検索結果ページの商品コンテナを1回のDOM走査で探す
+        product_elements = tree.css(PRODUCT_CONTAINER_SELECTOR)
         
         # 重複を除去（同じASINを持つ要素を統合）
         seen_asins = set()
         unique_elements = []
         for element in product_elements:
-            asin = element.get("data-asin")
+            asin = element.attributes.get("data-asin")
             if not asin:
                 # data-asinがない場合は、リンクからASINを抽出
-                link_tag = element.find("a", href=re.compile(r"/dp/|/gp/product/"))
+                link_tag = element.css_first(PRODUCT_LINK_SELECTOR)
                 if link_tag:
-                    href = link_tag.get("href", "")
+                    href = link_tag.attributes.get("href") or ""
                     if href.startswith("/"):
                         href = urljoin(url, href)
                     asin = extract_asin_from_url(href)
@@ -400,7 +434,7 @@ def scrape_search_page(url: str) -> list[dict]:
 # メイン処理
 # ============================================================================
 
-def import_ranking():
+def import_ranking(compact: bool = False):
     """キーワード検索から商品をインポートする"""
     
     # アフィリエイトIDの確認
@@ -417,14 +451,22 @@ def import_ranking():
 
     # 既存の商品データを読み込む
     if DATA_FILE.exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            products = json.load(f)
+        products = orjson.loads(DATA_FILE.read_bytes())
     else:
         products = []
 
     # 既存のASINセットを取得（重複チェック用）
     existing_asins = get_existing_asins(products)
 
+    # 次に割り当てる商品IDを1回だけ計算し、登録ごとに1ずつ進める
+    next_id = int(get_next_id(products))
+
+    # 今回の実行で登録する商品の価格履歴にはすべて同じ登録日時を使う
+    now_iso = datetime.now(timezone.utc).isoformat()
+
+    # カテゴリマッピングを読み込み、キーワード照合用の正規表現を1回だけ構築する
+    keyword_index = build_keyword_index(load_category_map())
+
     # keywords.txtを読み込む
     with open(KEYWORDS_FILE, "r", encoding="utf-8") as f:
         keywords = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
@@ -441,43 +483,40 @@ def import_ranking():
     total_failed = 0
     MAX_PRODUCTS = 150  # 最大登録件数の制限
 
-    # 各キーワードを処理
-    for keyword_idx, keyword in enumerate(keywords, 1):
-        print(f"[{keyword_idx}/{len(keywords)}] キーワード: {keyword}")
-        
-        # 最大件数に達した場合は処理を停止
-        if total_added >= MAX_PRODUCTS:
-            print(f"  最大登録件数（{MAX_PRODUCTS}件）に達したため、処理を停止します")
-            break
-
-        # 各キーワードにつき複数ページを巡回
-        for page in range(1, PAGES_PER_KEYWORD + 1):
-            # 最大件数に達した場合は処理を停止
-            if total_added >= MAX_PRODUCTS:
-                break
+    # 全キーワード・全ページの検索URLをスレッドプールで並列に取得し、結果はキーワード・ページ順に登録する
+    search_jobs = [
+        (keyword, page, build_search_url(keyword, page))
+        for keyword in keywords
+        for page in range(1, PAGES_PER_KEYWORD + 1)
+    ]
+
+    # 最大件数に達したときに、待機中のワーカーがリクエストを送らないようにするための停止指示
+    stop_event = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(scrape_search_page, search_url, stop_event)
+            for _, _, search_url in search_jobs
+        ]
 
-            # 検索URLを構築
-            search_url = build_search_url(keyword, page)
-            print(f"  ページ {page}/{PAGES_PER_KEYWORD}: {search_url}")
+        for job_idx, ((keyword, page, search_url), future) in enumerate(zip(search_jobs, futures), 1):
+            print(f"[{job_idx}/{len(futures)}] キーワード: {keyword} ページ {page}/{PAGES_PER_KEYWORD}: {search_url}")
 
-            # 検索結果ページから商品を抽出
-            scraped_products = scrape_search_page(search_url)
+            scraped_products = future.result()
 
             if not scraped_products:
                 print(f"  スキップ: 商品が見つかりませんでした")
                 if page == 1:
                     total_failed += 1
                 # 次のページに進む
-                random_sleep(2, 4)
                 continue
 
             # 各商品を登録
             for product_info in scraped_products:
                 # 最大件数に達した場合は処理を停止
                 if total_added >= MAX_PRODUCTS:
-                    print(f"  最大登録件数（{MAX_PRODUCTS}件）に達したため、処理を停止します")
                     break
-                
+            
                 asin = product_info["asin"]
 
                 # 重複チェック（ASINベース）
@@ -490,21 +529,23 @@ def import_ranking():
                 affiliate_url = build_affiliate_url(asin)
 
                 # カテゴリを割り当て
-                category = assign_category(product_info["name"], category_map)
+                category = assign_category(product_info["name"], keyword_index)
 
                 # 新しい商品データを作成
-                new_id = get_next_id(products)
+                new_id = str(next_id)
+                next_id += 1
                 new_product = {
                     "id": new_id,
                     "name": product_info["name"],
                     "currentPrice": product_info["price"],
                     "priceHistory": [
                         {
-                            "date": datetime.now(timezone.utc).isoformat(),
+                            "date": now_iso,
                             "price": product_info["price"],
                         }
                     ],
                     "affiliateUrl": affiliate_url,
+                    "asin": asin,
                     "imageUrl": product_info["image_url"],
                     "category": category,  # カテゴリを埋め込む
                 }
@@ -515,16 +556,16 @@ def import_ranking():
 
                 print(f"  ✓ 追加: {product_info['name'][:50]}... (ASIN={asin}, 価格=¥{product_info['price']:,})")
 
-            # サーバー負荷を考慮してランダムに2〜5秒待機
-            if page < PAGES_PER_KEYWORD:
-                random_sleep(2, 5)
-            elif keyword_idx < len(keywords):
-                # キーワード間は少し長めに待機
-                random_sleep(3, 6)
+            # 最大件数に達した場合は、待機中のワーカーを止め、まだ開始していないリクエストを取り消して処理を停止
+            if total_added >= MAX_PRODUCTS:
+                print(f"  最大登録件数（{MAX_PRODUCTS}件）に達したため、処理を停止します")
+                stop_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
 
     # JSONファイルに保存
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(products, f, ensure_ascii=False, indent=2)
+    option = None if compact else orjson.OPT_INDENT_2
+    write_bytes_atomic(DATA_FILE, orjson.dumps(products, option=option))
 
     # ログ出力
     print(f"\n{'='*60}")
@@ -538,4 +579,7 @@ def import_ranking():
 
 
 if __name__ == "__main__":
-    import_ranking()
+    parser = argparse.ArgumentParser(description="キーワード検索からAmazon商品を収集して products.json に追記する")
+    parser.add_argument("--compact", action="store_true", help="products.json をインデントなしのコンパクト形式で保存する（既定はインデント付き）")
+    args = parser.parse_args()
+    import_ranking(compact=args.compact)
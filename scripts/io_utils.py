@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+scripts/ 配下のスクリプトで共有するファイル入出力・HTTPアクセスのユーティリティ
+各スクリプトは `python scripts/xxx.py` で実行され scripts/ が sys.path に入るため、`from io_utils import ...` で読み込める
+"""
+
+import random
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    """
+    一時ファイルに書き出してから置き換えることで、書き込み途中で中断されても元のファイルを壊さない
+    """
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+class DomainRateLimiter:
+    """
+    ドメインごとにリクエスト間隔を空けるレートリミッター（サーバー負荷対策）
+    異なるドメインへのリクエストは並列に実行し、同じドメインへのリクエストだけを順番に間隔を空けて送る
+    間隔は min_seconds〜max_seconds の範囲でランダムに決める
+    """
+
+    def __init__(self, min_seconds: float, max_seconds: float):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self._next_allowed: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str, stop_event: threading.Event | None = None) -> bool:
+        """
+        URLのドメインに対して次にリクエストしてよい時刻まで待機する
+        stop_event を渡した場合、待機中にセットされたらすぐに戻り False を返す（リクエストを送らずに中止するため）
+        """
+        domain = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_allowed.get(domain, now))
+            self._next_allowed[domain] = start_at + random.uniform(self.min_seconds, self.max_seconds)
+        if stop_event is None:
+            time.sleep(start_at - now)
+            return True
+        return not stop_event.wait(start_at - now)
+
+
+def create_session(headers: dict[str, str], max_workers: int) -> requests.Session:
+    """
+    接続を使い回すHTTPセッションを作成する
+    2回目以降のリクエストではTCP/TLSハンドシェイクを省略でき、一時的なエラーは自動で再試行する
+    接続プールは同時にリクエストするスレッド数（max_workers）に合わせて確保する
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(
+        pool_connections=max_workers,
+        pool_maxsize=max_workers * 2,
+        max_retries=Retry(total=3, backoff_factor=1),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
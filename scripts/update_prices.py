@@ -4,15 +4,17 @@ Amazon商品の価格をスクレイピングして更新するスクリプト
 取得失敗時やURLがダミーの場合は、ランダム変動をフォールバックとして使用
 """
 
-import json
 import random
 import re
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+from io_utils import DomainRateLimiter, create_session, write_bytes_atomic
 
 # プロジェクトルートのパスを取得
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -28,43 +30,54 @@ HEADERS = {
     "Upgrade-Insecure-Requests": "1",
 }
 
+# 価格を表示する要素のセレクタ（priceblock の価格、a-price-whole、data-a-color="price"）
+PRICE_SELECTOR = "#priceblock_ourprice, #priceblock_dealprice, .a-price-whole, [data-a-color='price']"
 
-def extract_price_from_html(html: str) -> int | None:
+# 商品ページを並列にスクレイピングするスレッド数
+MAX_WORKERS = 4
+
+# 同じドメインへのリクエスト間隔（秒）。この範囲でランダムに間隔を空ける
+REQUEST_INTERVAL_RANGE = (0.5, 1.0)
+
+# 価格テキストから数字の並びを抽出する正規表現
+_DIGITS_RE = re.compile(r"\d+")
+
+
+# 全リクエストで共有するHTTPセッション
+SESSION = create_session(HEADERS, MAX_WORKERS)
+
+
+# 全スレッドで共有するレートリミッター
+RATE_LIMITER = DomainRateLimiter(*REQUEST_INTERVAL_RANGE)
+
+
+def _price_element_priority(element) -> int:
     """
-    HTMLから価格を抽出する
-    Amazonの価格表示パターンを複数試行
+    価格要素の優先順位を返す（小さいほど優先）
+    priceblock の価格 → a-price-whole → data-a-color="price" の順に採用する
     """
-    soup = BeautifulSoup(html, "html.parser")
+    attrs = element.attributes
+    element_id = attrs.get("id")
+    if element_id == "priceblock_ourprice":
+        return 0
+    if element_id == "priceblock_dealprice":
+        return 1
+    if "a-price-whole" in (attrs.get("class") or "").split():
+        return 2
+    return 3
 
-    # パターン1: id="priceblock_ourprice" または id="priceblock_dealprice"
-    price_element = soup.find(id="priceblock_ourprice") or soup.find(id="priceblock_dealprice")
-    if price_element:
-        price_text = price_element.get_text(strip=True)
-        price = parse_price(price_text)
-        if price:
-            return price
 
-    # パターン2: class="a-price-whole"
-    price_element = soup.find(class_="a-price-whole")
-    if price_element:
-        price_text = price_element.get_text(strip=True)
-        price = parse_price(price_text)
-        if price:
-            return price
+def extract_price_from_html(html: str) -> int | None:
+    """
+    HTMLから価格を抽出する
+    Amazonの価格表示パターンを1つの複合セレクタでまとめて探し、優先順位の高いものから試行
+    """
+    tree = LexborHTMLParser(html)
 
-    # パターン3: span.a-price-whole を含む要素を探す
-    price_elements = soup.find_all("span", class_="a-price-whole")
+    # DOMの走査は1回だけ行い、見つかった要素を優先順位順（同順位は文書順）に並べ替える
+    price_elements = sorted(tree.css(PRICE_SELECTOR), key=_price_element_priority)
     for element in price_elements:
-        price_text = element.get_text(strip=True)
-        price = parse_price(price_text)
-        if price:
-            return price
-
-    # パターン4: data-a-color="price" を含む要素
-    price_element = soup.find(attrs={"data-a-color": "price"})
-    if price_element:
-        price_text = price_element.get_text(strip=True)
-        price = parse_price(price_text)
+        price = parse_price(element.text(strip=True))
         if price:
             return price
 
@@ -76,14 +89,9 @@ def parse_price(price_text: str) -> int | None:
     価格テキストから数値を抽出する
     "¥248,000" -> 248000
     """
-    # カンマと通貨記号を除去して数値を抽出
-    price_match = re.search(r"[\d,]+", price_text.replace(",", ""))
-    if price_match:
-        try:
-            return int(price_match.group().replace(",", ""))
-        except ValueError:
-            return None
-    return None
+    # カンマを除去してから最初の数字の並びを抽出
+    price_match = _DIGITS_RE.search(price_text.replace(",", ""))
+    return int(price_match.group()) if price_match else None
 
 
 def scrape_price(url: str) -> int | None:
@@ -91,8 +99,11 @@ def scrape_price(url: str) -> int | None:
     Amazon商品ページから価格をスクレイピングする
     成功時は価格を返し、失敗時はNoneを返す
     """
+    # サーバー負荷を考慮して、同じドメインへのリクエストは間隔を空ける
+    RATE_LIMITER.wait(url)
+
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = SESSION.get(url, timeout=10)
         if response.status_code == 200:
             price = extract_price_from_html(response.text)
             return price
@@ -121,27 +132,33 @@ def update_prices():
     print("INFO: 価格更新を開始します（CIタイムアウト防止のため先頭5件に制限）")
 
     # JSONファイルを読み込む
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        products = json.load(f)
+    products = orjson.loads(DATA_FILE.read_bytes())
 
     # CI環境でのテスト実行を保証するため、最初の5商品のみ処理する（一時的な措置）
     limited_products = products[:5]
 
-    # 各商品の価格を更新
-    for product in limited_products:
+    # 今回の実行で追加する価格履歴にはすべて同じ更新日時を使う
+    now_iso = datetime.now(timezone.utc).isoformat()
+
+    # Amazonの商品ページをスレッドプールで並列にスクレイピングする（同じドメインへの間隔はレートリミッターで制御）
+    scraped_prices: dict[int, int | None] = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for idx, product in enumerate(limited_products):
+            url = product.get("affiliateUrl", "")
+            if url and url.startswith("https://www.amazon.co.jp"):
+                print(f"スクレイピング中: {product['name']} ({url})")
+                futures[executor.submit(scrape_price, url)] = idx
+            else:
+                print(f"スキップ: {product['name']} (URLがダミーまたは無効)")
+
+        for future in as_completed(futures):
+            scraped_prices[futures[future]] = future.result()
+
+    # 各商品の価格を元の順序で更新
+    for idx, product in enumerate(limited_products):
         old_price = product["currentPrice"]
-        new_price = None
-
-        # スクレイピングを試行
-        url = product.get("affiliateUrl", "")
-        if url and url.startswith("https://www.amazon.co.jp"):
-            print(f"スクレイピング中: {product['name']} ({url})")
-            new_price = scrape_price(url)
-            
-            # サーバー負荷を考慮してリクエスト間に2秒待機
-            time.sleep(2)
-        else:
-            print(f"スキップ: {product['name']} (URLがダミーまたは無効)")
+        new_price = scraped_prices.get(idx)
 
         # スクレイピング失敗時はフォールバック
         if new_price is None:
@@ -153,20 +170,19 @@ def update_prices():
 
         # 価格履歴に新しいエントリを追加
         new_entry = {
-            "date": datetime.now(timezone.utc).isoformat(),
+            "date": now_iso,
             "price": new_price,
         }
         product["priceHistory"].append(new_entry)
 
-        # 価格履歴が長すぎる場合は古いものを削除（最新30件を保持）
-        if len(product["priceHistory"]) > 30:
-            product["priceHistory"] = product["priceHistory"][-30:]
+        # 価格履歴が長すぎる場合は古いものをその場で削除（最新30件を保持、新しいリストは作らない）
+        del product["priceHistory"][:-30]
 
         print(f"更新完了: {product['name']} - ¥{old_price:,} -> ¥{new_price:,}")
 
     # JSONファイルに保存（全商品を書き戻す）
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(products, f, ensure_ascii=False, indent=2)
+    # CIが定期的にコミットするファイルなので、差分をレビューできるよう常にインデント付きで保存する
+    write_bytes_atomic(DATA_FILE, orjson.dumps(products, option=orjson.OPT_INDENT_2))
 
     print(f"価格を更新しました: {datetime.now().isoformat()}")
 
@@ -9,11 +9,18 @@
 4. ASINの形式チェック
 """
 
-import json
+import re
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any, BinaryIO
+
+import orjson
+
+try:
+    import ijson
+except ImportError:  # ijson が無い環境では orjson で一括読み込みする
+    ijson = None
 
 # データファイルのパス
 DATA_FILE = Path(__file__).parent.parent / "data" / "products.json"
@@ -21,64 +28,55 @@ DATA_FILE = Path(__file__).parent.parent / "data" / "products.json"
 # 必須フィールド
 REQUIRED_FIELDS = ["id", "name", "currentPrice", "affiliateUrl"]
 
+# JSONのパースに失敗したときに送出される例外
+JSON_PARSE_ERRORS = (orjson.JSONDecodeError,) if ijson is None else (orjson.JSONDecodeError, ijson.JSONError)
+
+# URLからASINを抽出する正規表現（/dp/ASIN または /gp/product/ASIN）
+_ASIN_RE = re.compile(r"/(?:dp|gp/product)/([A-Z0-9]{10})")
+
 
 def extract_asin_from_url(url: str) -> str | None:
     """URLからASINを抽出"""
-    import re
-    match = re.search(r"/dp/([A-Z0-9]{10})|/gp/product/([A-Z0-9]{10})", url)
-    if match:
-        return match.group(1) or match.group(2)
-    return None
+    match = _ASIN_RE.search(url)
+    return match.group(1) if match else None
 
 
-def validate_price_history(history: List[Dict[str, Any]], product_id: str) -> List[str]:
-    """価格履歴の時系列順序を検証"""
-    errors = []
-    
-    if not history:
-        return errors
-    
-    # 日付でソートして、時系列順序を確認
-    sorted_history = sorted(history, key=lambda x: x.get("date", ""))
-    
-    # 元の順序と比較
-    if history != sorted_history:
-        errors.append(f"商品ID {product_id}: 価格履歴が時系列順序でない")
-    
-    # 各エントリの日付形式を確認
-    for i, entry in enumerate(history):
-        date_str = entry.get("date", "")
-        if not date_str:
-            errors.append(f"商品ID {product_id}: 価格履歴[{i}]に日付がない")
-            continue
-        
-        try:
-            datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-        except ValueError:
-            errors.append(f"商品ID {product_id}: 価格履歴[{i}]の日付形式が不正: {date_str}")
+def iter_products(f: BinaryIO) -> Iterable[Dict[str, Any]] | None:
+    """
+    商品データを1件ずつ返すイテラブルを作成する（データが配列形式でない場合は None）
+    ijson がインストールされていればストリーミングで読み込み、無ければ orjson で一括読み込みする
+    """
+    if ijson is None:
+        products = orjson.loads(f.read())
+        return products if isinstance(products, list) else None
     
-    return errors
+    # 最初のイベントだけを読んで配列形式かを確認し、先頭に戻ってから要素を1件ずつ読み込む
+    _, first_event, _ = next(ijson.parse(f))
+    if first_event != "start_array":
+        return None
+    f.seek(0)
+    # 小数は Decimal ではなく float として受け取る（価格の型チェックのため）
+    return ijson.items(f, "item", use_float=True)
 
 
-def validate_required_fields(product: Dict[str, Any], product_id: str) -> List[str]:
-    """必須フィールドの存在をチェック"""
+def validate_product(product: Dict[str, Any], index: int) -> List[str]:
+    """単一商品の検証（各フィールドの取得と価格履歴の走査は1回だけ行う）"""
+    product_id = product.get("id", f"index_{index}")
+    current_price = product.get("currentPrice")
+    history = product.get("priceHistory") or []
+    affiliate_url = product.get("affiliateUrl", "")
+    asin = product.get("asin")
+    
     errors = []
     
+    # 必須フィールドのチェック
     for field in REQUIRED_FIELDS:
         if field not in product:
             errors.append(f"商品ID {product_id}: 必須フィールド '{field}' が存在しません")
         elif not product[field]:
             errors.append(f"商品ID {product_id}: 必須フィールド '{field}' が空です")
     
-    return errors
-
-
-def validate_price(product: Dict[str, Any], product_id: str) -> List[str]:
-    """価格の妥当性をチェック"""
-    errors = []
-    
     # 現在価格のチェック
-    current_price = product.get("currentPrice")
     if current_price is None:
         errors.append(f"商品ID {product_id}: currentPrice が存在しません")
     elif not isinstance(current_price, (int, float)):
@@ -86,27 +84,47 @@ def validate_price(product: Dict[str, Any], product_id: str) -> List[str]:
     elif current_price <= 0:
         errors.append(f"商品ID {product_id}: currentPrice が0以下です: {current_price}")
     
-    # 価格履歴のチェック
-    history = product.get("priceHistory", [])
+    # 価格履歴を1回だけ走査し、価格の妥当性・日付形式・時系列順序をまとめて確認する
+    # （エラーの表示順は従来どおり「価格」→「時系列順序」→「日付」）
+    price_errors = []
+    date_errors = []
+    out_of_order = False
+    prev_date = ""
     for i, entry in enumerate(history):
         price = entry.get("price")
         if price is None:
-            errors.append(f"商品ID {product_id}: 価格履歴[{i}]にpriceが存在しません")
+            price_errors.append(f"商品ID {product_id}: 価格履歴[{i}]にpriceが存在しません")
         elif not isinstance(price, (int, float)):
-            errors.append(f"商品ID {product_id}: 価格履歴[{i}]のpriceが数値ではありません: {price}")
+            price_errors.append(f"商品ID {product_id}: 価格履歴[{i}]のpriceが数値ではありません: {price}")
         elif price < 0:
-            errors.append(f"商品ID {product_id}: 価格履歴[{i}]のpriceが負の値です: {price}")
+            price_errors.append(f"商品ID {product_id}: 価格履歴[{i}]のpriceが負の値です: {price}")
+        
+        # 日付が null や 0 の場合は「日付がない」として扱う
+        date_str = entry.get("date") or ""
+        if not isinstance(date_str, str):
+            date_errors.append(f"商品ID {product_id}: 価格履歴[{i}]の日付形式が不正: {date_str}")
+            continue
+        
+        if date_str < prev_date:
+            out_of_order = True
+        prev_date = date_str
+        
+        if not date_str:
+            date_errors.append(f"商品ID {product_id}: 価格履歴[{i}]に日付がない")
+            continue
+        
+        try:
+            datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+        except ValueError:
+            date_errors.append(f"商品ID {product_id}: 価格履歴[{i}]の日付形式が不正: {date_str}")
     
-    return errors
-
-
-def validate_asin(product: Dict[str, Any], product_id: str) -> List[str]:
-    """ASINの形式をチェック"""
-    errors = []
+    errors.extend(price_errors)
+    if out_of_order:
+        errors.append(f"商品ID {product_id}: 価格履歴が時系列順序でない")
+    errors.extend(date_errors)
     
-    # ASINフィールドがある場合
-    if "asin" in product and product["asin"]:
-        asin = product["asin"]
+    # ASINの形式チェック（ASINフィールドがある場合）
+    if asin:
         if not isinstance(asin, str):
             errors.append(f"商品ID {product_id}: asin が文字列ではありません: {asin}")
         elif len(asin) != 10:
@@ -115,33 +133,8 @@ def validate_asin(product: Dict[str, Any], product_id: str) -> List[str]:
             errors.append(f"商品ID {product_id}: asin に無効な文字が含まれています: {asin}")
     
     # affiliateUrlからASINを抽出して検証
-    affiliate_url = product.get("affiliateUrl", "")
-    if affiliate_url:
-        extracted_asin = extract_asin_from_url(affiliate_url)
-        if not extracted_asin:
-            errors.append(f"商品ID {product_id}: affiliateUrl からASINを抽出できません: {affiliate_url}")
-    
-    return errors
-
-
-def validate_product(product: Dict[str, Any], index: int) -> List[str]:
-    """単一商品の検証"""
-    errors = []
-    product_id = product.get("id", f"index_{index}")
-    
-    # 必須フィールドのチェック
-    errors.extend(validate_required_fields(product, product_id))
-    
-    # 価格の妥当性チェック
-    errors.extend(validate_price(product, product_id))
-    
-    # 価格履歴の時系列順序チェック
-    history = product.get("priceHistory", [])
-    if history:
-        errors.extend(validate_price_history(history, product_id))
-    
-    # ASINの形式チェック
-    errors.extend(validate_asin(product, product_id))
+    if affiliate_url and not extract_asin_from_url(affiliate_url):
+        errors.append(f"商品ID {product_id}: affiliateUrl からASINを抽出できません: {affiliate_url}")
     
     return errors
 
@@ -158,35 +151,41 @@ def main():
         print(f"❌ エラー: データファイルが見つかりません: {DATA_FILE}")
         sys.exit(1)
     
-    # データファイルの読み込み
+    # 各商品を読み込みながら検証（ijson があれば1件ずつストリーミングし、ファイル全体をメモリに載せない）
+    all_errors = []
+    products_with_errors = set()
+    total_count = 0
+    
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            products = json.load(f)
-    except json.JSONDecodeError as e:
+        with open(DATA_FILE, "rb") as f:
+            products = iter_products(f)
+            if products is None:
+                print("❌ エラー: データが配列形式ではありません")
+                sys.exit(1)
+            
+            for i, product in enumerate(products):
+                total_count += 1
+                # 商品がオブジェクトでない場合（壊れたファイルの途中までを読んだ場合など）は、それ自体をエラーとして扱う
+                if not isinstance(product, dict):
+                    all_errors.append(f"商品ID index_{i}: 商品データがオブジェクト形式ではありません: {product!r}")
+                    products_with_errors.add(f"index_{i}")
+                    continue
+                
+                errors = validate_product(product, i)
+                if errors:
+                    all_errors.extend(errors)
+                    product_id = product.get("id", f"index_{i}")
+                    products_with_errors.add(product_id)
+    except JSON_PARSE_ERRORS as e:
         print(f"❌ エラー: JSONのパースに失敗しました: {e}")
         sys.exit(1)
-    except Exception as e:
+    except OSError as e:
         print(f"❌ エラー: ファイルの読み込みに失敗しました: {e}")
         sys.exit(1)
     
-    if not isinstance(products, list):
-        print("❌ エラー: データが配列形式ではありません")
-        sys.exit(1)
-    
-    print(f"📦 総商品数: {len(products)}")
+    print(f"📦 総商品数: {total_count}")
     print()
     
-    # 各商品を検証
-    all_errors = []
-    products_with_errors = set()
-    
-    for i, product in enumerate(products):
-        errors = validate_product(product, i)
-        if errors:
-            all_errors.extend(errors)
-            product_id = product.get("id", f"index_{i}")
-            products_with_errors.add(product_id)
-    
     # 結果の表示
     print("=" * 60)
     print("検証結果")
@@ -197,7 +196,7 @@ def main():
         print(f"⚠️  問題が見つかりました:")
         print(f"   - エラー数: {len(all_errors)}")
         print(f"   - 問題のある商品数: {len(products_with_errors)}")
-        print(f"   - 総商品数: {len(products)}")
+        print(f"   - 総商品数: {total_count}")
         print()
         print("詳細なエラー:")
         print("-" * 60)
@@ -210,7 +209,7 @@ def main():
         sys.exit(1)
     else:
         print("✅ すべての検証項目を通過しました")
-        print(f"   - 検証商品数: {len(products)}")
+        print(f"   - 検証商品数: {total_count}")
         print()
         print("=" * 60)
         print("✅ 検証成功: データに問題はありません")